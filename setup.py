@@ -19,11 +19,19 @@ pypi_classifiers = [
 ]
 
 install_requires = [
+    "numpy",
     "pandas>=0.20.3",
     'biopython>=1.70',
     "pymummer>=0.10.3",
 ]
 
+extras_require = {
+    'pyhmmer': ['pyhmmer>=0.7.0'],
+    'pysam': ['pysam>=0.15'],
+    'pyfastx': ['pyfastx>=0.8'],
+    'numba': ['numba'],
+}
+
 desc = """Map TIR-pHMM models to genomic sequences for annotation of MITES and complete DNA-Transposons."""
 
 setup(name='tirmite',
@@ -39,6 +47,7 @@ setup(name='tirmite',
       classifiers=pypi_classifiers,
       keywords=["Transposon", "TIR", "MITE", "TE", "HMM"],
       install_requires=install_requires,
+      extras_require=extras_require,
       include_package_data=True,
       zip_safe=False,
       entry_points={
@@ -9,22 +9,53 @@ complete DNA-Transposons.
 import re
 import os
 import sys
+import gzip
+import functools
 import glob
 import shutil
 import tempfile
 import subprocess
+from io import StringIO
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from Bio import SeqIO
 from Bio import AlignIO
+from Bio.Seq import Seq, reverse_complement
+from Bio.SeqRecord import SeqRecord
 from datetime import datetime
 from collections import Counter
 from collections import namedtuple
 from operator import attrgetter
-from .hmmer_wrappers import _hmmbuild_command, _hmmpress_command, _nhmmer_command
-from .bowtie2_wrappers import _bowtie2build_cmd, _bowtie2_cmd, _bam2bed_cmd
+from .hmmer_wrappers import _hmmbuild_command, _hmmpress_command, _nhmmer_command, _nhmmer_base_command
+from .bowtie2_wrappers import _bowtie2build_cmd, _bowtie2_cmd, _run_bowtie2_pipeline
 from .runBlastn import makeBlast, run_blast
 from pymummer import coords_file, alignment, nucmer
 
+try:
+    import pyhmmer
+except ImportError:
+    pyhmmer = None
+
+try:
+    import pyfastx
+except ImportError:
+    pyfastx = None
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        '''Run functions as plain Python if numba is not installed.'''
+        def decorator(func):
+            return func
+        return decorator
+
 __version__ = "1.1.4"
 
 
@@ -123,12 +154,13 @@ def _write_script(cmds, script):
     f.close()
 
 
-def syscall(cmd, verbose=False):
-    '''Manage error handling when making syscalls'''
+def syscall(cmd, verbose=False, stdin=None):
+    '''Manage error handling when making syscalls.
+    Optionally pass bytes to the command on stdin.'''
     if verbose:
         print('Running command:', cmd, flush=True)
     try:
-        output = subprocess.check_output(cmd, shell=True,
+        output = subprocess.check_output(cmd, shell=True, input=stdin,
                                          stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError as error:
         print('The following command failed with exit code', error.returncode,
@@ -156,6 +188,16 @@ def run_cmd(cmds, verbose=False, tempDir=None, keeptemp=False):
         shutil.rmtree(tmpdir)
 
 
+def run_parallel(cmds, workers=1, verbose=False):
+    '''Execute independent commands concurrently.'''
+    workers = max(1, min(workers, len(cmds)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(syscall, cmd, verbose=verbose) for cmd in cmds]
+        # Raise first error, if any
+        for job in jobs:
+            job.result()
+
+
 def isfile(path):
     if not os.path.isfile(path):
         print("Input file not found: %s" % path)
@@ -194,10 +236,66 @@ def manageTemp(record=None, tempPath=None, scrub=False):
             SeqIO.write(record, f, "fasta")
 
 
+def cleanTemp(tempDir):
+    """Remove temp directory without waiting for deletion to finish.
+    The directory is renamed out of the way and deleted by a background
+    rm process. Falls back to shutil.rmtree if this is not possible."""
+    trash = tempDir + '.trash'
+    try:
+        os.replace(tempDir, trash)
+    except OSError:
+        shutil.rmtree(tempDir)
+        return
+    try:
+        subprocess.Popen(['rm', '-rf', trash], stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        # No rm available
+        shutil.rmtree(trash)
+
+
+def _iterFasta(file):
+    """Minimal multifasta reader. Yields (title, seq) strings."""
+    reader = None
+    if pyfastx is not None:
+        try:
+            reader = pyfastx.Fastx(file, comment=True)
+        except RuntimeError:
+            # Empty or malformed file, leave to reader below
+            reader = None
+    if reader is not None:
+        for name, seq, comment in reader:
+            if ' ' in seq:
+                seq = seq.replace(' ', '')
+            yield (name + ' ' + (comment or '')).rstrip(), seq
+        return
+    with open(file, 'rb') as f:
+        data = f.read()
+    # Step through records by header position, skipping any leading text
+    pos = 0 if data.startswith(b'>') else data.find(b'\n>') + 1
+    if data[pos:pos + 1] != b'>':
+        return
+    while True:
+        hend = data.find(b'\n', pos)
+        if hend < 0:
+            hend = len(data)
+        nxt = data.find(b'\n>', hend)
+        end = len(data) if nxt < 0 else nxt
+        yield (data[pos + 1:hend].rstrip().decode(),
+               data[hend:end].translate(None, b'\n\r ').decode())
+        if nxt < 0:
+            return
+        pos = nxt + 1
+
+
 def importFasta(file):
     """Load elements from multifasta file. Check that seq IDs are unique."""
-    # Read in elements from multifasta file, convert seqrecord iterator to list
-    records = list(SeqIO.parse(file, "fasta"))
+    # Read in elements from multifasta file as SeqRecords
+    records = list()
+    for title, seq in _iterFasta(file):
+        seqID = title.split(None, 1)[0] if title else ''
+        records.append(SeqRecord(Seq(seq), id=seqID, name=seqID,
+                                 description=title))
     # Check names are unique
     checkUniqueID(records)
     # If unique, return records as dict keyed by seq id
@@ -207,6 +305,155 @@ def importFasta(file):
     return recordsDict
 
 
+def _openFasta(path):
+    '''Open plain or gzip/bgzip compressed fasta in binary mode.'''
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _countFastaHeaders(path):
+    '''Count header lines in fasta file, reading in 1 Mb blocks.'''
+    count = 0
+    prev = b'\n'
+    with _openFasta(path) as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            count += block.count(b'\n>')
+            # Header at start of file, or split across blocks
+            if prev == b'\n' and block[:1] == b'>':
+                count += 1
+            prev = block[-1:]
+    return count
+
+
+def _fastaHeaderIDs(path):
+    '''Return list of sequence IDs from fasta header lines.'''
+    with _openFasta(path) as f:
+        return [decode(line[1:]).split(None, 1)[0] if line[1:].strip()
+                else '' for line in f if line.startswith(b'>')]
+
+
+class IndexedGenome(object):
+    '''Dict-like access to sequences in an indexed fasta file.
+    Sequences are read from disk as required rather than held in memory.
+    Reads are made in fixed size chunks, and the most recently used chunks
+    are cached (200 x 128 kb by default) so nearby hits share reads.'''
+
+    chunkSize = 131072
+
+    def __init__(self, file, cacheChunks=200, checkIDs=True):
+        self.path = os.path.abspath(file)
+        # Builds .fai index next to fasta if it does not exist
+        self.fasta = pysam.FastaFile(self.path)
+        self._chunk = functools.lru_cache(maxsize=cacheChunks)(self._readChunk)
+        # The index silently keeps only the first of any duplicate IDs, so
+        # compare against headers in the fasta file
+        if checkIDs and _countFastaHeaders(self.path) != self.fasta.nreferences:
+            checkUniqueID([fastaRec(x, '', '') for x in
+                           _fastaHeaderIDs(self.path)])
+
+    def __getitem__(self, chrom):
+        if chrom not in self.fasta:
+            raise KeyError(chrom)
+        return ChromView(self, chrom)
+
+    def __contains__(self, chrom):
+        return chrom in self.fasta
+
+    def __iter__(self):
+        return iter(self.fasta.references)
+
+    def __len__(self):
+        return self.fasta.nreferences
+
+    def keys(self):
+        return list(self.fasta.references)
+
+    def length(self, chrom):
+        return self.fasta.get_reference_length(chrom)
+
+    def _readChunk(self, chrom, chunkID):
+        start = chunkID * self.chunkSize
+        return self.fasta.fetch(chrom, start, start + self.chunkSize)
+
+    def fetch(self, chrom, start, end):
+        '''Return sequence of chrom[start:end] as a string.'''
+        start, end, step = slice(start, end).indices(self.length(chrom))
+        if end <= start:
+            return ''
+        # Assemble region from cached chunks
+        first = start // self.chunkSize
+        last = (end - 1) // self.chunkSize
+        seq = ''.join([self._chunk(chrom, x) for x in range(first, last + 1)])
+        offset = first * self.chunkSize
+        return seq[start - offset:end - offset]
+
+
+class InMemoryGenome(object):
+    '''Dict-like access to sequences loaded with importFasta(), with the
+    same fetch() interface as IndexedGenome.'''
+
+    def __init__(self, records):
+        self.records = records
+
+    def __getitem__(self, chrom):
+        return self.records[chrom]
+
+    def __contains__(self, chrom):
+        return chrom in self.records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def keys(self):
+        return list(self.records.keys())
+
+    def fetch(self, chrom, start, end):
+        '''Return sequence of chrom[start:end] as a string.'''
+        return str(self.records[chrom].seq[start:end])
+
+
+class ChromView(object):
+    '''Single sequence from an IndexedGenome. Slicing fetches the
+    requested region and returns it as a SeqRecord.'''
+
+    def __init__(self, genome, chrom):
+        self.genome = genome
+        self.chrom = chrom
+
+    def __len__(self):
+        return self.genome.length(self.chrom)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("Genome sequences can only be sliced.")
+        seq = self.genome.fetch(self.chrom, index.start, index.stop)
+        if index.step:
+            seq = seq[::index.step]
+        return SeqRecord(Seq(seq), id=self.chrom, name=self.chrom,
+                         description='')
+
+
+def loadGenome(file):
+    """Open genome for random access. Use an indexed fasta if pysam is
+    available, else load all records into memory."""
+    if pysam is not None:
+        try:
+            return IndexedGenome(file)
+        except (OSError, ValueError) as e:
+            print("WARNING: Could not index genome %s (%s). Loading into \
+memory." % (file, str(e)), file=sys.stderr)
+    return InMemoryGenome(importFasta(file))
+
+
 def getbtName(file):
     """Load seqs from file. Check if more than one record.
     Report first id lable."""
@@ -219,7 +466,16 @@ def getbtName(file):
     return cleanID(str(records[0].id))
 
 
-def cmdScript(hmmDir=None, hmmFile=None, alnDir=None, tempDir=None, args=None):
+def nhmmerThreads(args):
+    ''' Threads per nhmmer process: --hmmThreads, capped by --cores.'''
+    return max(1, min(args.hmmThreads, args.cores))
+
+
+def cmdScript(hmmDir=None, hmmFile=None, alnDir=None, tempDir=None, args=None,
+              alignments=None):
+    ''' Stage models in hmmDB and compose nhmmer commands. Models are built
+    from Stockholm files in alnDir, or from (name, stockholm) pairs in
+    alignments which are piped to hmmbuild.'''
     if tempDir:
         tempDir = os.path.abspath(tempDir)
         if not os.path.isdir(tempDir):
@@ -250,19 +506,31 @@ def cmdScript(hmmDir=None, hmmFile=None, alnDir=None, tempDir=None, args=None):
                                                        outdir=tempDir)
             build_cmds.append(hmmbuildCmd)
         run_cmd(build_cmds, verbose=args.verbose, keeptemp=args.keeptemp)
-    # Press and write nhmmer cmd for all models in hmmDB directory
+    if alignments:
+        for modelName, stockholm in alignments:
+            hmmbuildCmd, modelPath = _hmmbuild_command(exePath=args.hmmbuild,
+                                                       modelname=modelName,
+                                                       cores=args.cores,
+                                                       inAlign='-',
+                                                       outdir=tempDir,
+                                                       informat='stockholm')
+            syscall(hmmbuildCmd, verbose=args.verbose,
+                    stdin=stockholm.encode())
+    # Press and write nhmmer cmd for all models in hmmDB directory.
+    # One cmd per model, so that models can be searched in parallel.
+    # Search options are the same for all models, build them once.
+    nhmmerBase = _nhmmer_base_command(exePath=args.nhmmer,
+                                      nobias=args.nobias,
+                                      matrix=args.matrix,
+                                      evalue=args.maxeval,
+                                      cores=nhmmerThreads(args))
     for hmm in glob.glob(os.path.join(hmmDB, '*.hmm')):
         hmmPressCmd = _hmmpress_command(exePath=args.hmmpress, hmmfile=hmm)
-        nhmmerCmd, resultDir = _nhmmer_command(exePath=args.nhmmer,
-                                               nobias=args.nobias,
-                                               matrix=args.matrix,
-                                               modelPath=hmm,
+        nhmmerCmd, resultDir = _nhmmer_command(modelPath=hmm,
                                                genome=args.genome,
-                                               evalue=args.maxeval,
-                                               cores=args.cores,
-                                               outdir=tempDir)
-        cmds.append(hmmPressCmd)
-        cmds.append(nhmmerCmd)
+                                               outdir=tempDir,
+                                               base=nhmmerBase)
+        cmds.append(hmmPressCmd + ' && ' + nhmmerCmd)
     # Return list of cmds and location of file result files
     return cmds, resultDir, hmmDB
 
@@ -301,41 +569,37 @@ def convertAlign(alnDir=None, alnFile=None, inFormat='fasta', tempDir=None):
     return alnOutDir
 
 
-def import_nhmmer(infile=None, hitTable=None, prefix=None):
-    ''' Read nhmmer tab files to pandas dataframe.'''
-    hitRecords = list()
-    with open(infile, "rU") as f:
-        for line in f.readlines():
-            li = line.strip()
-            if not li.startswith("#"):
-                li = li.split()
-                if li[11] == '+':
-                    hitRecords.append({
-                        'target': li[0],
-                        'model': li[2],
-                        'hmmStart': li[4],
-                        'hmmEnd': li[5],
-                        'hitStart': li[6],
-                        'hitEnd': li[7],
-                        'strand': li[11],
-                        'evalue': li[12],
-                        'score': li[13],
-                        'bias': li[14]})
-                elif li[11] == '-':
-                    hitRecords.append({
-                        'target': li[0],
-                        'model': li[2],
-                        'hmmStart': li[4],
-                        'hmmEnd': li[5],
-                        'hitStart': li[7],
-                        'hitEnd': li[6],
-                        'strand': li[11],
-                        'evalue': li[12],
-                        'score': li[13],
-                        'bias': li[14]})
-    # Convert list of dicts into dataframe
-    df = pd.DataFrame(hitRecords)
-    # Reorder columns
+def iterStockholm(alnDir=None, alnFile=None, inFormat='fasta'):
+    ''' Convert input alignments into Stockholm format in memory.
+    Yields (name, stockholm text) for each alignment file.'''
+    # Get list of alignment files to process
+    if alnFile:
+        alignments = [alnFile]
+    else:
+        alignments = glob.glob(os.path.join(alnDir, '*'))
+    for infile in alignments:
+        # Get basename
+        inBase = os.path.splitext(os.path.basename(infile))[0]
+        # Read alignment and write as stockholm
+        output_handle = StringIO()
+        with open(infile, "r") as input_handle:
+            AlignIO.write(AlignIO.parse(input_handle, inFormat),
+                          output_handle, "stockholm")
+        yield inBase, output_handle.getvalue()
+
+
+def castScores(df):
+    ''' Store score and bias columns as float32. E-values are kept as float64,
+    as small e-values underflow to zero in float32. Missing values (NA)
+    become NaN.'''
+    df['evalue'] = pd.to_numeric(df['evalue'], errors='coerce').astype(np.float64)
+    for col in ['score', 'bias']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    return df
+
+
+def read_nhmmer(infile=None):
+    ''' Read single nhmmer tab file to unsorted pandas dataframe.'''
     cols = ['model',
             'target',
             'hitStart',
@@ -346,25 +610,193 @@ def import_nhmmer(infile=None, hitTable=None, prefix=None):
             'bias',
             'hmmStart',
             'hmmEnd']
-    df = df.ix[:, cols]
-    if hitTable is not None:
-        # If an existing table was passed, concatenate
-        df = pd.concat([df, hitTable], ignore_index=True)
+    # Only the first 15 fields are fixed, target descriptions may contain
+    # whitespace.
+    try:
+        tab = pd.read_csv(infile, sep=r'\s+', comment='#', header=None,
+                          usecols=range(15), dtype={0: str, 2: str, 11: str},
+                          engine='c')
+    except pd.errors.EmptyDataError:
+        return castScores(pd.DataFrame(columns=cols))
+    tab = tab.loc[tab[11].isin(['+', '-'])]
+    # Report hit coords low to high, ali from/to are reversed on - strand
+    rev = tab[11] == '-'
+    df = pd.DataFrame({'model': tab[2],
+                       'target': tab[0],
+                       'hitStart': tab[6].where(~rev, tab[7]),
+                       'hitEnd': tab[7].where(~rev, tab[6]),
+                       'strand': tab[11],
+                       'evalue': tab[12],
+                       'score': tab[13],
+                       'bias': tab[14],
+                       'hmmStart': tab[4],
+                       'hmmEnd': tab[5]})
+    return castScores(df.loc[:, cols])
+
+
+def mergeHits(frames):
+    ''' Concatenate hit tables once, then sort and reindex.'''
+    # Skip empty tables so they do not reset column dtypes
+    nonEmpty = [f for f in frames if not f.empty]
+    df = pd.concat(nonEmpty or frames, ignore_index=True)
     # Sort hits by HMM, Chromosome, location, and strand
     df = df.sort_values(['model', 'target', 'hitStart', 'hitEnd', 'strand'],
                         ascending=[True, True, True, True, True])
     # Reindex
     df = df.reset_index(drop=True)
+    return df
+
+
+def import_nhmmer(infile=None, hitTable=None, prefix=None):
+    ''' Read nhmmer tab files to pandas dataframe.'''
+    frames = [read_nhmmer(infile=infile)]
+    if hitTable is not None:
+        # If an existing table was passed, concatenate
+        frames.append(hitTable)
     # if prefix:
     #    df['model'] = str(prefix) + '_' + df['model'].astype(str)
-    return df
+    return mergeHits(frames)
+
+
+def readMaxLengths(hmm_paths=None):
+    '''Read MAXL (max expected hit length) from the header of each model in
+    HMMER3 text files. Returns dict of max length keyed by model name.
+    Models without MAXL are omitted.'''
+    maxLens = dict()
+    for hmmPath in hmm_paths:
+        hmmName = None
+        with open(hmmPath, "r") as f:
+            for line in f:
+                li = line.strip()
+                if li.startswith("NAME"):
+                    hmmName = str(li.split()[1])
+                elif li.startswith("MAXL") and hmmName:
+                    maxLens[hmmName] = int(li.split()[1])
+                elif li.startswith("//"):
+                    # End of model
+                    hmmName = None
+    return maxLens
+
+
+def loadProfiles(hmm_paths=None, cache=None):
+    '''Read HMMs once and convert to optimized profiles for nhmmer search.
+    If cache is set, models are read from a merged binary HMM file if it is
+    newer than all input models, else the cache is rebuilt.
+    Returns dict of OptimizedProfileBlocks keyed by model max length, and a
+    list of HMMs without a max length to be searched as HMMs.'''
+    alphabet = pyhmmer.easel.Alphabet.dna()
+    background = pyhmmer.plan7.Background(alphabet)
+    # Check if cached models are up to date
+    useCache = False
+    if cache and os.path.isfile(cache):
+        cacheTime = os.path.getmtime(cache)
+        sources = list(hmm_paths) + [os.path.dirname(os.path.abspath(cache))]
+        useCache = all(os.path.getmtime(x) <= cacheTime for x in sources)
+    # Load all query models
+    hmms = list()
+    if useCache:
+        print("Log: Loading cached models from: %s " % cache, file=sys.stderr)
+        with pyhmmer.plan7.HMMFile(cache) as hmmFile:
+            hmms.extend(hmmFile)
+    else:
+        for hmmPath in hmm_paths:
+            with pyhmmer.plan7.HMMFile(hmmPath) as hmmFile:
+                hmms.extend(hmmFile)
+        if cache:
+            try:
+                with open(cache, 'wb') as f:
+                    for hmm in hmms:
+                        hmm.write(f, binary=True)
+                print("Log: Wrote model cache: %s " % cache, file=sys.stderr)
+            except OSError:
+                print("WARNING: Could not write model cache: %s " % cache,
+                      file=sys.stderr)
+    # Configure and optimize each profile once. Profiles are grouped by
+    # max length, which nhmmer uses as the scanning window length. MAXL is
+    # read from the source model text, as pyhmmer does not expose it.
+    maxLens = readMaxLengths(hmm_paths=hmm_paths)
+    profileBlocks = dict()
+    unsized = list()
+    for hmm in hmms:
+        maxLen = maxLens.get(decode(hmm.name), -1)
+        if maxLen < 1:
+            unsized.append(hmm)
+            continue
+        profile = pyhmmer.plan7.Profile(hmm.M, alphabet)
+        profile.configure(hmm, background, L=100)
+        if maxLen not in profileBlocks:
+            profileBlocks[maxLen] = pyhmmer.plan7.OptimizedProfileBlock(alphabet)
+        profileBlocks[maxLen].append(profile.to_optimized())
+    return profileBlocks, unsized
+
+
+def run_nhmmer_pyhmmer(genome=None, hmm_paths=None, args=None, cache=None):
+    '''Search genome with HMMs in-process using the pyhmmer nhmmer pipeline.
+    Returns hits as a pandas dataframe in the same layout as import_nhmmer(),
+    or None if no hits were reported.'''
+    alphabet = pyhmmer.easel.Alphabet.dna()
+    # Load target sequences once as a digital sequence block
+    with pyhmmer.easel.SequenceFile(genome, digital=True,
+                                    alphabet=alphabet) as seqFile:
+        seqs = seqFile.read_block()
+    # Load optimized profiles for all query models
+    profileBlocks, unsized = loadProfiles(hmm_paths=hmm_paths, cache=cache)
+    searches = [(block, {'window_length': maxLen})
+                for maxLen, block in profileBlocks.items()]
+    if unsized:
+        searches.append((unsized, {}))
+    # Run search. Filter thresholds of 1.0 and no bias filter match the
+    # nhmmer "--max" option used in the subprocess path.
+    hitRecords = list()
+    for queries, options in searches:
+        results = pyhmmer.nhmmer(queries, seqs,
+                                 cpus=args.cores,
+                                 E=args.maxeval,
+                                 F1=1.0, F2=1.0, F3=1.0,
+                                 bias_filter=False,
+                                 **options)
+        for query, topHits in zip(queries, results):
+            for hit in topHits:
+                if not hit.reported:
+                    continue
+                domain = hit.best_domain
+                aln = domain.alignment
+                # Report hit coords low to high, as for tab files
+                hitRecords.append({
+                    'target': decode(hit.name),
+                    'model': decode(query.name),
+                    'hmmStart': aln.hmm_from,
+                    'hmmEnd': aln.hmm_to,
+                    'hitStart': min(aln.target_from, aln.target_to),
+                    'hitEnd': max(aln.target_from, aln.target_to),
+                    'strand': domain.strand,
+                    # Round values to the precision of nhmmer tblout
+                    'evalue': float('%.2g' % hit.evalue),
+                    'score': float('%.1f' % hit.score),
+                    'bias': float('%.1f' % hit.bias)})
+    if not hitRecords:
+        return None
+    # Convert list of dicts into dataframe
+    df = pd.DataFrame(hitRecords)
+    # Reorder columns
+    cols = ['model',
+            'target',
+            'hitStart',
+            'hitEnd',
+            'strand',
+            'evalue',
+            'score',
+            'bias',
+            'hmmStart',
+            'hmmEnd']
+    return mergeHits([castScores(df.loc[:, cols])])
 
 
 def import_BED(infile=None, hitTable=None, prefix=None):
     ''' Read TIR bedfile to pandas dataframe.'''
     # Format: Chrm, start, end, name, evalue, strand
     hitRecords = list()
-    with open(infile, "rU") as f:
+    with open(infile, "r") as f:
         for line in f.readlines():
             li = line.strip()
             if not li.startswith("#"):
@@ -374,8 +806,8 @@ def import_BED(infile=None, hitTable=None, prefix=None):
                     'model': li[3],
                     'hmmStart': 'NA',
                     'hmmEnd': 'NA',
-                    'hitStart': li[1],
-                    'hitEnd': li[2],
+                    'hitStart': int(li[1]),
+                    'hitEnd': int(li[2]),
                     'strand': li[5],
                     'evalue': li[4],
                     'score': 'NA',
@@ -393,7 +825,7 @@ def import_BED(infile=None, hitTable=None, prefix=None):
             'bias',
             'hmmStart',
             'hmmEnd']
-    df = df.ix[:, cols]
+    df = castScores(df.loc[:, cols])
     if hitTable is not None:
         # If an existing table was passed, concatenate
         df = pd.concat([df, hitTable], ignore_index=True)
@@ -411,7 +843,7 @@ def import_mapped(infile=None, tirName="refTIR", hitTable=None, prefix=None):
     ''' Read bowtie2 mapped TIR locations from bedfile to pandas dataframe.'''
     print('Bowtie2 mapped reads will not be filtered on e-value.')
     hitRecords = list()
-    with open(infile, "rU") as f:
+    with open(infile, "r") as f:
         for line in f.readlines():
             li = line.strip()
             if not li.startswith("#"):
@@ -453,7 +885,7 @@ def import_mapped(infile=None, tirName="refTIR", hitTable=None, prefix=None):
             'bias',
             'hmmStart',
             'hmmEnd']
-    df = df.ix[:, cols]
+    df = castScores(df.loc[:, cols])
     if hitTable is not None:
         # If an existing table was passed, concatenate
         df = pd.concat([df, hitTable], ignore_index=True)
@@ -467,12 +899,17 @@ def import_mapped(infile=None, tirName="refTIR", hitTable=None, prefix=None):
     return df
 
 
-def filterHitsLen(hmmDB=None, mincov=None, hitTable=None):
+def filterHitsLen(hmmDB=None, mincov=None, hitTable=None, hmmFiles=None):
+    ''' Filter hitTable df to remove hits shorter than mincov * model length.
+    Model lengths are read from hmmFiles, or all models in hmmDB if not set.
+    '''
     modelLens = dict()
-    for hmm in glob.glob(os.path.join(hmmDB, '*.hmm')):
+    if hmmFiles is None:
+        hmmFiles = glob.glob(os.path.join(hmmDB, '*.hmm'))
+    for hmm in hmmFiles:
         hmmLen = None
         hmmName = None
-        with open(hmm, "rU") as f:
+        with open(hmm, "r") as f:
             for line in f.readlines():
                 li = line.strip()
                 if li.startswith("LENG"):
@@ -483,27 +920,33 @@ def filterHitsLen(hmmDB=None, mincov=None, hitTable=None):
                 modelLens[hmmName] = hmmLen
     for model in modelLens.keys():
         minlen = modelLens[model] * mincov
-        hitTable = hitTable.ix[~((hitTable['model'] == model) &
-                                 ((hitTable['hitEnd'].astype(int) -
-                                   hitTable['hitStart'].astype(int)) +
-                                  1 < minlen)
-                                 )
-                               ]
+        hitTable = hitTable.loc[~((hitTable['model'] == model) &
+                                  ((hitTable['hitEnd'].astype(int) -
+                                    hitTable['hitStart'].astype(int)) +
+                                   1 < minlen)
+                                  )
+                                ]
     return hitTable
 
 
 def filterHitsEval(maxeval=None, hitTable=None):
     ''' Filter hitTable df to remove hits with e-value in excess of --maxeval.
     '''
-    hitTable = hitTable.ix[((hitTable['evalue'].astype(float))
-                            < float(maxeval))
-                           ]
+    hitTable = hitTable.loc[hitTable['evalue'].values.astype(np.float64)
+                            < float(maxeval)]
     return hitTable
 
 
+# Hit coordinates for one model on one chromosome, one array per field.
+# Strand is stored as 1 (+), -1 (-) or 0 (other).
+hitArrays = namedtuple('hitArrays', ['starts', 'ends', 'strand', 'idx',
+                                     'evalue'])
+
+
 def table2dict(hitTable):
     ''' Convert pandas dataframe of nhmmer hits into dict[model][chrom]
-        and index[model] = [hitlist].withCandidates and pairing status'''
+        of hitArrays, and index[model] = [hitlist].withCandidates and
+        pairing status'''
     # Set up empty dict
     hitsDict = dict()
     hitIndex = dict()
@@ -511,8 +954,20 @@ def table2dict(hitTable):
     for hmm in hitTable.model.unique():
         hitsDict[hmm] = dict()
         hitIndex[hmm] = dict()
-        for chr in hitTable[hitTable['model'] == hmm].target.unique():
-            hitsDict[hmm][chr] = list()
+    # Field arrays for all hits
+    starts = hitTable['hitStart'].values.astype(np.int64)
+    ends = hitTable['hitEnd'].values.astype(np.int64)
+    strands = hitTable['strand'].values
+    strand = np.zeros(len(strands), dtype=np.int8)
+    strand[strands == '+'] = 1
+    strand[strands == '-'] = -1
+    idx = hitTable.index.values.astype(np.int64)
+    evalue = hitTable['evalue'].values.astype(np.float64)
+    # Split arrays by model and chromosome, keeping table order
+    groups = hitTable.groupby(['model', 'target'], sort=False).indices
+    for (model, chr), pos in groups.items():
+        hitsDict[model][chr] = hitArrays(starts[pos], ends[pos], strand[pos],
+                                         idx[pos], evalue[pos])
     # Set up named tuple
     hitTup = namedtuple('Elem', ['model',
                                  'target',
@@ -521,206 +976,311 @@ def table2dict(hitTable):
                                  'strand',
                                  'idx',
                                  'evalue'])
-    # Add each record to dicts
-    for row in hitTable.iterrows():
-        record = hitTup(row[1].model,
-                        row[1].target,
-                        int(row[1].hitStart),
-                        int(row[1].hitEnd),
-                        row[1].strand,
-                        row[0],
-                        row[1].evalue)
-        # Log hit for model on chromosome
-        hitsDict[row[1].model][row[1].target].append(record)
+    # Add each record to tracker
+    for row in zip(hitTable['model'], hitTable['target'], starts.tolist(),
+                   ends.tolist(), hitTable['strand'], hitTable.index,
+                   hitTable['evalue']):
+        record = hitTup(*row)
         # Populate tracker
-        hitIndex[hmm][row[0]] = {'rec': record,
-                                 'partner': None,
-                                 'candidates': list()
-                                 }
+        hitIndex[hmm][record.idx] = {'rec': record,
+                                     'partner': None,
+                                     'candidates': list()
+                                     }
     # Return master rec object and pairing tracker
     return hitsDict, hitIndex
 
 
 def parseHits(hitsDict=None, hitIndex=None, maxDist=None):
-    '''Populate hitIndex with pairing candidates'''
+    '''Populate hitIndex with pairing candidates.
+    Hits on each chromosome are sorted once by strand, then the window of
+    valid partners for every hit is found by binary search.'''
     if not maxDist:
         maxDist = float('inf')
+    # Map hit IDs to tracker entries
+    entries = dict()
     for hmm in hitIndex.keys():
         for UID in hitIndex[hmm].keys():
-            ref = hitIndex[hmm][UID]['rec']
-            if ref.strand == '+':
-                for localhit in hitsDict[ref.model][ref.target]:
-                    if localhit.strand == '-' and localhit.hitStart >= ref.hitEnd and localhit.hitStart - ref.hitEnd <= maxDist:
-                        hitIndex[hmm][UID]['candidates'].append(localhit)
-                # Sort candidate hit records from low to high on hitStart vals
-                hitIndex[hmm][UID]['candidates'] = sorted(
-                    hitIndex[hmm][UID]['candidates'],
-                    key=attrgetter('hitStart', 'hitEnd'))
-            if ref.strand == '-':
-                for localhit in hitsDict[ref.model][ref.target]:
-                    if localhit.strand == '+' and localhit.hitEnd <= ref.hitStart and ref.hitStart - localhit.hitEnd <= maxDist:
-                        hitIndex[hmm][UID]['candidates'].append(localhit)
-                # Sort candidate hit records from high to low on hitEnd values
-                hitIndex[hmm][UID]['candidates'] = sorted(
-                    hitIndex[hmm][UID]['candidates'],
-                    key=attrgetter('hitEnd', 'hitStart'),
-                    reverse=True)
+            entries[UID] = hitIndex[hmm][UID]
+    for model in hitsDict.keys():
+        for target in hitsDict[model].keys():
+            hits = hitsDict[model][target]
+            plusPos = np.flatnonzero(hits.strand == 1)
+            minusPos = np.flatnonzero(hits.strand == -1)
+            # Candidates for + strand hits: - strand hits sorted from low to
+            # high on hitStart vals
+            minusSorted = minusPos[np.lexsort((hits.ends[minusPos],
+                                               hits.starts[minusPos]))]
+            minusStarts = hits.starts[minusSorted]
+            # Candidates for - strand hits: + strand hits sorted from high to
+            # low on hitEnd values. Sort reversed list ascending and read
+            # windows backwards to keep order of equal hits.
+            plusRev = plusPos[::-1]
+            plusSorted = plusRev[np.lexsort((hits.starts[plusRev],
+                                             hits.ends[plusRev]))]
+            plusEnds = hits.ends[plusSorted]
+            # Candidate records, in sorted order
+            minusRecs = [entries[x]['rec'] for x in hits.idx[minusSorted]]
+            plusRecs = [entries[x]['rec'] for x in hits.idx[plusSorted]]
+            # + strand refs: partner hitStart in [ref.hitEnd, ref.hitEnd + maxDist]
+            refEnds = hits.ends[plusPos]
+            lo = np.searchsorted(minusStarts, refEnds, side='left')
+            hi = np.searchsorted(minusStarts, refEnds + maxDist, side='right')
+            for ref, a, b in zip(hits.idx[plusPos], lo, hi):
+                entries[ref]['candidates'] = minusRecs[a:b]
+            # - strand refs: partner hitEnd in [ref.hitStart - maxDist, ref.hitStart]
+            refStarts = hits.starts[minusPos]
+            lo = np.searchsorted(plusEnds, refStarts - maxDist, side='left')
+            hi = np.searchsorted(plusEnds, refStarts, side='right')
+            for ref, a, b in zip(hits.idx[minusPos], lo, hi):
+                entries[ref]['candidates'] = plusRecs[a:b][::-1]
     # hitIndex[model][idx].keys() == [rec,candidates,partner]
     return hitIndex
 
 
-def isfirstUnpaired(ref=None, mate=None, model=None, index=None):
-    '''Provided with a hitID (ref) and the ID of its nearest unpaired
-    candidate partner (mate), check if ref is also the nearest unpaired
-    partner to mate.'''
-    # Init result trackers
-    found = None
-    mateFUP = None
-    # Scan candidate partners of 'mate' looking for ref
-    for matePartner in index[model][mate]['candidates']:
-        # If unpaired candidate is ref
-        if not index[model][matePartner.idx]['partner'] and matePartner.idx == ref:
-            found = set([matePartner.idx, mate])
-            index[model][ref]['partner'] = mate
-            index[model][mate]['partner'] = ref
-            # return
-            return found, index, mateFUP
-        # If first unpaired candidate partner for mate is not ref
-        elif not index[model][matePartner.idx]['partner']:
-            # Return none and unchanged index
-            mateFUP = matePartner.idx
-            return found, index, mateFUP
-        else:
-            continue
-    # If mate candidates include no unpaired reps, return unchanged index
-    # and blank 'found' and 'mateFUP' variables.
-    return found, index, mateFUP
-
-
-def getPairs(hitIndex=None, paired=None):
-    '''Loop over all hit for all models and search for reciprocity within
-        2 degrees of the top unpaired candidate for each unpaired hit.'''
-    # If pair tracker not given
-    if not paired:
-        # Create dict of empty lists, keyed by model name
-        paired = dict()
-        for model in hitIndex.keys():
-            paired[model] = list()
-    # For each HMM model
-    for model in hitIndex.keys():
-        # Ask each hit in genome
-        for refID in hitIndex[model].keys():
-            # If it has been asigned a partner
-            if not hitIndex[model][refID]['partner']:
-                # If not partnered, start checking candidate partners
-                for Can1 in hitIndex[model][refID]['candidates']:
-                    # For a candidate that is also unpartnered
-                    if not hitIndex[model][Can1.idx]['partner']:
-                        # Check if unpartnered candidate is a reciprocal
-                        # match for our hit
-                        found, hitIndex, mateFUP = isfirstUnpaired(
-                            ref=refID,
-                            mate=Can1.idx,
-                            model=model,
-                            index=hitIndex
-                            )
+@njit(cache=True)
+def _firstUnpaired(ref, mate, candPtr, candIdx, partner):
+    '''If ref is the first unpaired candidate of mate, pair them and
+    return True. Else return False and the first unpaired candidate of
+    mate (-1 if none).'''
+    for k in range(candPtr[mate], candPtr[mate + 1]):
+        matePartner = candIdx[k]
+        if partner[matePartner] < 0:
+            if matePartner == ref:
+                partner[ref] = mate
+                partner[mate] = ref
+                return True, -1
+            return False, matePartner
+    return False, -1
+
+
+@njit(cache=True)
+def _getPairs(candPtr, candIdx, partner, pairA, pairB, nPairs):
+    '''One pass of the pairing procedure over all unpaired hits.
+    Hits pair if each is the other's first unpaired candidate.
+    New pairs are appended to pairA/pairB from position nPairs.
+    Returns updated pair count.'''
+    for refID in range(partner.shape[0]):
+        if partner[refID] < 0:
+            for k in range(candPtr[refID], candPtr[refID + 1]):
+                can1 = candIdx[k]
+                if partner[can1] < 0:
+                    found, mateFUP = _firstUnpaired(refID, can1, candPtr,
+                                                    candIdx, partner)
+                    if found:
+                        pairA[nPairs] = refID
+                        pairB[nPairs] = can1
+                        nPairs += 1
+                    elif mateFUP >= 0:
+                        found, nextFUP = _firstUnpaired(can1, mateFUP, candPtr,
+                                                        candIdx, partner)
                         if found:
-                            # If current hit is also the best return match of
-                            # our candidate, store as pair.
-                            paired[model].append(found)
-                        elif mateFUP:
-                            # Else if not a return match, check candidate's
-                            # first outbound match for reciprocity.
-                            found, hitIndex, mateFUP = isfirstUnpaired(
-                                ref=Can1.idx,
-                                mate=mateFUP,
-                                model=model,
-                                index=hitIndex)
-                            if found:
-                                # Store if found.
-                                paired[model].append(found)
-    return hitIndex, paired
-
-
-def countUnpaired(hitIndex):
-    '''How many hits are still unpaired across all models.'''
-    count = 0
-    for model in hitIndex.keys():
-        for hitID in hitIndex[model].keys():
-            if not hitIndex[model][hitID]['partner']:
-                count += 1
-    return count
-
-
-def listunpaired(hitIndex):
-    '''Return list of all unpaired hit IDs'''
-    unpaired = list()
-    for model in hitIndex.keys():
-        for hitID in hitIndex[model].keys():
-            if not hitIndex[model][hitID]['partner']:
-                unpaired.append(hitID)
-    return unpaired
-
-
-def iterateGetPairs(hitIndex, stableReps=0):
-    ''' Iterate pairing procedure for all models until no unpaired hits remain or
-        number of reps without change is exceeded.'''
-    # Init stable repeat counter
+                            pairA[nPairs] = can1
+                            pairB[nPairs] = mateFUP
+                            nPairs += 1
+    return nPairs
+
+
+@njit(cache=True)
+def _iterateGetPairs(candPtr, candIdx, partner, stableReps):
+    '''Array version of the iterative pairing procedure.
+    Returns arrays of paired hit positions.'''
+    # Each hit can be paired at most once
+    pairA = np.empty(partner.shape[0] // 2 + 1, dtype=np.int64)
+    pairB = np.empty(partner.shape[0] // 2 + 1, dtype=np.int64)
     reps = 0
-    # Run initial pairing
-    hitIndex, paired = getPairs(hitIndex=hitIndex)
-    # Count remaining unpaired hits
-    countUP = countUnpaired(hitIndex)
-    # Iterate pairing procedure until either no unpaired remain
-    # OR max number of interations without new pairing is reached
+    nPairs = _getPairs(candPtr, candIdx, partner, pairA, pairB, 0)
+    countUP = np.sum(partner < 0)
     while countUP > 0 and reps < stableReps:
-        # Re-run pairing procedure
-        hitIndex, paired = getPairs(hitIndex=hitIndex, paired=paired)
-        # Store previous unpaired hit count
+        nPairs = _getPairs(candPtr, candIdx, partner, pairA, pairB, nPairs)
         lastCountUP = countUP
-        # Update unpaired hit count
-        countUP = countUnpaired(hitIndex)
-        # If no change in upaired hit count, iterate stable rep counter
+        countUP = np.sum(partner < 0)
         if lastCountUP == countUP:
             reps += 1
+    return pairA[:nPairs], pairB[:nPairs]
+
+
+def iterateGetPairs(hitIndex, stableReps=0):
+    ''' Iterate pairing procedure for all models until no unpaired hits remain or
+        number of reps without change is exceeded.
+        hitIndex is flattened to arrays for the pairing loop, which is compiled
+        with numba if available.'''
+    # Flatten hits to positions, in model then hit order
+    hitIDs = list()
+    hitModels = list()
+    for model in hitIndex.keys():
+        for hitID in hitIndex[model].keys():
+            hitIDs.append(hitID)
+            hitModels.append(model)
+    hitPos = dict((hitID, i) for i, hitID in enumerate(hitIDs))
+    entries = [hitIndex[model][hitID] for model, hitID in zip(hitModels, hitIDs)]
+    # Partner positions, -1 if unpaired
+    partner = np.array([-1 if x['partner'] is None else hitPos[x['partner']]
+                        for x in entries], dtype=np.int64)
+    # Candidate lists as offsets into a single array
+    candPtr = np.zeros(len(entries) + 1, dtype=np.int64)
+    candPtr[1:] = np.cumsum([len(x['candidates']) for x in entries])
+    candIdx = np.array([hitPos[c.idx] for x in entries for c in x['candidates']],
+                       dtype=np.int64)
+    # Run iterative pairing procedure
+    pairA, pairB = _iterateGetPairs(candPtr, candIdx, partner, stableReps)
+    # Unpack results
+    paired = dict()
+    for model in hitIndex.keys():
+        paired[model] = list()
+    for a, b in zip(pairA, pairB):
+        paired[hitModels[a]].append(set([hitIDs[a], hitIDs[b]]))
+    for i, x in enumerate(entries):
+        if partner[i] >= 0:
+            x['partner'] = hitIDs[partner[i]]
     # Get IDs of remaining unpaired hits
-    unpaired = listunpaired(hitIndex)
+    unpaired = [hitIDs[i] for i in np.flatnonzero(partner < 0)]
     # Return results
     return hitIndex, paired, unpaired
 
 
+# Sequence record for fasta output
+fastaRec = namedtuple('fastaRec', ['id', 'description', 'seq'])
+
+
+def formatFasta(seqID, description, seq, width=60):
+    ''' Format a single fasta record as bytes. Sequence lines are wrapped
+    at the same width as SeqIO.write().'''
+    header = '>' + seqID
+    if description:
+        header += ' ' + description
+    lines = [header] + [seq[i:i + width] for i in range(0, len(seq), width)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def fetchPadded(genome=None, chrom=None, start=None, end=None, padlen=None):
+    ''' Fetch 1-based inclusive region from genome. If padlen is set,
+    also fetch x bases either side in lower case.'''
+    seq = genome.fetch(chrom, start - 1, end)
+    if padlen:
+        seq = genome.fetch(chrom, start - 1 - padlen, start - 1).lower() + \
+            seq + genome.fetch(chrom, end, end + padlen).lower()
+    return seq
+
+
+# Genome handle opened once in each fetchRegions worker process
+_workerGenome = None
+
+
+def _initFetchWorker(path):
+    ''' Open indexed genome once per worker process.'''
+    global _workerGenome
+    # IDs were checked when the genome was first loaded
+    _workerGenome = IndexedGenome(path, checkIDs=False)
+
+
+def _fetchBatch(path, batch, padlen):
+    ''' Worker for fetchRegions. Fetches (start, end) regions for a batch
+    of (chrom, coords) using the genome handle of this worker process.'''
+    if _workerGenome is None or _workerGenome.path != path:
+        # No initializer support (Python < 3.7)
+        _initFetchWorker(path)
+    return [[fetchPadded(genome=_workerGenome, chrom=chrom, start=start,
+                         end=end, padlen=padlen) for start, end in coords]
+            for chrom, coords in batch]
+
+
+def fetchPool(genome=None, cores=1):
+    ''' Start worker pool for fetchRegions, with the genome opened once in
+    each worker. Returns None if genome is not indexed on disk or cores < 2.
+    Caller should shutdown() the pool when done.'''
+    if cores <= 1 or not isinstance(genome, IndexedGenome):
+        return None
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(max_workers=cores,
+                                   initializer=_initFetchWorker,
+                                   initargs=(genome.path,))
+    return ProcessPoolExecutor(max_workers=cores)
+
+
+def fetchRegions(genome=None, regions=None, padlen=None, cores=1, pool=None,
+                 minPoolRegions=20000):
+    ''' Fetch list of 1-based inclusive (chrom, start, end) regions.
+    Returns sequences in input order. If genome is indexed on disk and
+    cores > 1, regions are fetched in parallel processes, grouped into
+    batches of chromosomes. An existing pool from fetchPool() can be
+    reused. Fewer than minPoolRegions regions are fetched in this process.'''
+    if cores <= 1 or not isinstance(genome, IndexedGenome) or \
+            len(regions) < minPoolRegions:
+        return [fetchPadded(genome=genome, chrom=chrom, start=start, end=end,
+                            padlen=padlen) for chrom, start, end in regions]
+    # Group region positions by chromosome
+    byChrom = dict()
+    for i, (chrom, start, end) in enumerate(regions):
+        byChrom.setdefault(chrom, list()).append(i)
+    # Split chromosomes into a few batches per worker of similar region count
+    batchSize = -(-len(regions) // (cores * 4))
+    batches = [[]]
+    batchCount = 0
+    for chrom, pos in byChrom.items():
+        if batchCount >= batchSize:
+            batches.append(list())
+            batchCount = 0
+        batches[-1].append((chrom, pos))
+        batchCount += len(pos)
+    ownPool = pool is None
+    if ownPool:
+        pool = fetchPool(genome=genome, cores=cores)
+    seqs = [None] * len(regions)
+    try:
+        jobs = [pool.submit(_fetchBatch, genome.path,
+                            [(chrom, [regions[i][1:] for i in pos])
+                             for chrom, pos in batch], padlen)
+                for batch in batches]
+        for batch, job in zip(batches, jobs):
+            for (chrom, pos), chromSeqs in zip(batch, job.result()):
+                for i, seq in zip(pos, chromSeqs):
+                    seqs[i] = seq
+    finally:
+        if ownPool:
+            pool.shutdown()
+    return seqs
+
+
+def extractAllTIRs(hitTable=None, maxeval=0.001, genome=None, padlen=None,
+                   cores=1, pool=None):
+    ''' For significant hits of all models, compose fasta records as
+    (id, description, seq) tuples. Sequences for all models are fetched
+    together. Returns dict of record lists keyed by model.'''
+    seqLists = dict((model, list()) for model in hitTable['model'].unique())
+    # Select significant hits
+    mask = hitTable['evalue'].values.astype(np.float64) <= maxeval
+    rows = list(hitTable.loc[mask].iterrows())
+    # Fetch all hit sequences
+    hitSeqs = fetchRegions(genome=genome,
+                           regions=[(row['target'], int(row['hitStart']),
+                                     int(row['hitEnd'])) for index, row in rows],
+                           padlen=padlen, cores=cores, pool=pool)
+    for (index, row), hitseq in zip(rows, hitSeqs):
+        model = row['model']
+        hitID = model + '_' + str(index)
+        if row['strand'] == '-':
+            hitseq = reverse_complement(hitseq)
+            hitID = hitID + "_rc"
+        description = '_'.join(['[' + str(row['target']) + ':' + str(row['strand']),str(row['hitStart']),str(row['hitEnd']) + ' modelAlignment:' + str(row['hmmStart']),str(row['hmmEnd']) + ' E-value:' + str(row['evalue']) + ']'])
+        # Append record to model list
+        seqLists[model].append((hitID, description, hitseq))
+    return seqLists
+
+
 def extractTIRs(model=None, hitTable=None, maxeval=0.001,
-                genome=None, padlen=None):
-    ''' For significant hits in model, compose seqrecords.'''
-    # Note: Padding not yet enabled for TIR extraction.
-    hitcount = 0
-    seqList = list()
-    for index, row in hitTable[hitTable['model'] == model].iterrows():
-        if float(row['evalue']) <= maxeval:
-            hitcount += 1
-            if padlen:
-                hitrecord = genome[row['target']][int(row['hitStart'])-1-padlen:int(row['hitStart'])-1].lower() + \
-                genome[row['target']][int(row['hitStart'])-1:int(row['hitEnd'])] + \
-                genome[row['target']][int(row['hitEnd']):int(row['hitEnd'])+padlen].lower()
-            else:
-                hitrecord = genome[row['target']][int(row['hitStart'])-1:int(row['hitEnd'])]
-            hitrecord.id = model + '_' + str(index)
-            if row['strand'] == '-':
-                hitrecord = hitrecord.reverse_complement(id=hitrecord.id + "_rc")
-            hitrecord.name = hitrecord.id
-            hitrecord.description = '_'.join(['[' + str(row['target']) + ':' + str(row['strand']),str(row['hitStart']),str(row['hitEnd']) + ' modelAlignment:' + row['hmmStart'],row['hmmEnd'] + ' E-value:' + str(row['evalue']) + ']'])
-            # Append record to list
-            seqList.append(hitrecord)
-        else:
-            continue
-    # Return seqrecord list and total hit count for model
-    return seqList, hitcount
+                genome=None, padlen=None, cores=1, pool=None):
+    ''' For significant hits in model, compose fasta records as
+    (id, description, seq) tuples.'''
+    seqList = extractAllTIRs(hitTable=hitTable[hitTable['model'] == model],
+                             maxeval=maxeval, genome=genome, padlen=padlen,
+                             cores=cores, pool=pool).get(model, list())
+    # Return record list and total hit count for model
+    return seqList, len(seqList)
 
 
 def writeTIRs(outDir=None, hitTable=None, maxeval=0.001,
-              genome=None, prefix=None, padlen=None):
+              genome=None, prefix=None, padlen=None, cores=1, pool=None):
     ''' Write all hits per Model to a multifasta in the outdir'''
-    # Note: Padding not yet enabled for TIR extraction.
     if prefix:
         prefix = cleanID(prefix) + '_'
     else:
@@ -731,20 +1291,20 @@ def writeTIRs(outDir=None, hitTable=None, maxeval=0.001,
             os.makedirs(outDir)
     else:
         outDir = os.getcwd()
-    for model in hitTable['model'].unique():
-        # List of TIR seqrecords, and count of hits
-        seqList, hitcount = extractTIRs(model=model,
-                                        hitTable=hitTable,
-                                        maxeval=maxeval,
-                                        genome=genome,
-                                        padlen=padlen)
+    # TIR records for all models, fetched in one pass
+    seqLists = extractAllTIRs(hitTable=hitTable,
+                              maxeval=maxeval,
+                              genome=genome,
+                              padlen=padlen,
+                              cores=cores,
+                              pool=pool)
+    for model, seqList in seqLists.items():
         outfile = os.path.join(outDir, prefix + model + "_hits_" +
-                               str(hitcount) + ".fasta")
+                               str(len(seqList)) + ".fasta")
         # Write extracted hits to model outfile
-        with open(outfile, "w") as handle:
-            for seq in seqList:
-                seq.id = prefix + str(seq.id)
-                SeqIO.write(seq, handle, "fasta")
+        with open(outfile, "wb", buffering=1 << 20) as handle:
+            for hitID, description, hitseq in seqList:
+                handle.write(formatFasta(prefix + hitID, description, hitseq))
 
 # CS10_Chromosome_02_+_88294_88353_modelAlignment:1_60
 
@@ -755,7 +1315,8 @@ def flipTIRs(x, y):
     return (left2right[0], left2right[1])
 
 
-def fetchElements(paired=None, hitIndex=None, genome=None):
+def fetchElements(paired=None, hitIndex=None, genome=None, cores=1,
+                  pool=None):
     ''' Extract complete sequence of paired elements,
         asign names and child TIRs for use in seq and GFF reporting.'''
     TIRelements = dict()
@@ -763,24 +1324,33 @@ def fetchElements(paired=None, hitIndex=None, genome=None):
                         ['model', 'chromosome', 'start', 'end', 'strand',
                          'type', 'id', 'leftHit', 'rightHit', 'seq', 'evalue']
                         )
+    # Order pairs and fetch all element sequences in one pass
+    pairs = list()
     for model in paired.keys():
-        TIRelements[model] = list()
-        model_counter = 0
         for x, y in paired[model]:
-            model_counter += 1
             x = hitIndex[model][x]['rec']
             y = hitIndex[model][y]['rec']
-            leftHit, rightHit = flipTIRs(x,y)
+            pairs.append((model,) + flipTIRs(x,y))
+    eleSeqs = iter(fetchRegions(genome=genome,
+                                regions=[(leftHit.target,
+                                          int(leftHit.hitStart),
+                                          int(rightHit.hitEnd))
+                                         for model, leftHit, rightHit in pairs],
+                                cores=cores, pool=pool))
+    pairs = iter(pairs)
+    for model in paired.keys():
+        TIRelements[model] = list()
+        model_counter = 0
+        for _ in paired[model]:
+            model_counter += 1
+            model, leftHit, rightHit = next(pairs)
             eleID = model + "_Element_" + str(model_counter)
-            eleSeq = genome[leftHit.target][int(leftHit.hitStart)-1:int(rightHit.hitEnd)]
-            eleSeq.id = eleID
-            eleSeq.name = eleID
-            eleSeq.description = '_'.join(['['
-                                           + leftHit.target
-                                           + ':'
-                                           + str(leftHit.hitStart),
-                                           str(rightHit.hitEnd)]) + " len="
-            + str(rightHit.hitEnd-leftHit.hitStart) + ']'
+            eleSeq = fastaRec(eleID,
+                              '_'.join(['[' + leftHit.target + ':'
+                                        + str(leftHit.hitStart),
+                                        str(rightHit.hitEnd)]) + " len="
+                              + str(rightHit.hitEnd-leftHit.hitStart) + ']',
+                              next(eleSeqs))
             TIRelement = gffTup(model,
                                 leftHit.target,
                                 leftHit.hitStart,
@@ -806,16 +1376,16 @@ def writeElements(outDir, eleDict=None, prefix=None):
         prefix = ''
     for model in eleDict.keys():
         outfile = os.path.join(outDir, prefix + model + '_elements.fasta')
-        with open(outfile, "w") as handle:
+        with open(outfile, "wb", buffering=1 << 20) as handle:
             for element in eleDict[model]:
-                element.seq.id = prefix + str(element.seq.id)
-                SeqIO.write(element.seq, handle, "fasta")
+                handle.write(formatFasta(prefix + element.seq.id,
+                                         element.seq.description,
+                                         element.seq.seq))
 
 
 def writePairedTIRs(outDir=None, paired=None, hitIndex=None,
                     genome=None, prefix=None, padlen=None):
     ''' Extract TIR sequence of paired hits, write to fasta.'''
-    # Note: Sequence padding not yet enabled for paired TIRs
     TIRpairs = dict()
     gffTup = namedtuple('gffElem', ['model', 'chromosome', 'start', 'end',
                                     'strand', 'type', 'id', 'leftHit',
@@ -830,27 +1400,25 @@ def writePairedTIRs(outDir=None, paired=None, hitIndex=None,
             leftHit, rightHit = flipTIRs(x, y)
             eleID = model + "_TIRpair_" + str(model_counter)
             # If padlen set, extract hit with x bases either side
-            if padlen:
-                eleSeqLeft = genome[leftHit.target][int(leftHit.hitStart)-1-padlen:int(leftHit.hitStart)-1].lower() + \
-                genome[leftHit.target][int(leftHit.hitStart)-1:int(leftHit.hitEnd)] + \
-                genome[leftHit.target][int(leftHit.hitEnd):int(leftHit.hitEnd)+padlen].lower()
-                eleSeqRight = genome[leftHit.target][int(rightHit.hitStart)-1-padlen:int(rightHit.hitStart)-1].lower() + \
-                genome[leftHit.target][int(rightHit.hitStart)-1:int(rightHit.hitEnd)] + \
-                genome[leftHit.target][int(rightHit.hitEnd):int(rightHit.hitEnd)+padlen].lower()
-            else:
-                eleSeqLeft = genome[leftHit.target][int(leftHit.hitStart)-1:int(leftHit.hitEnd)]
-                eleSeqRight = genome[leftHit.target][int(rightHit.hitStart)-1:int(rightHit.hitEnd)]
-            eleSeqRight = eleSeqRight.reverse_complement()
-            eleSeqLeft.id = eleID + "_L"
-            eleSeqLeft.name = eleID + "_L"
-            eleSeqLeft.description = '_'.join(['[' + leftHit.target + ':'
-                                               + str(leftHit.hitStart),
-                                               str(leftHit.hitEnd)]) + ']'
-            eleSeqRight.id = eleID + "_R"
-            eleSeqRight.name = eleID + "_R"
-            eleSeqRight.description = '_'.join(['[' + leftHit.target + ':'
-                                                + str(rightHit.hitEnd),
-                                                str(rightHit.hitStart)]) + ']'
+            eleSeqLeft = fastaRec(eleID + "_L",
+                                  '_'.join(['[' + leftHit.target + ':'
+                                            + str(leftHit.hitStart),
+                                            str(leftHit.hitEnd)]) + ']',
+                                  fetchPadded(genome=genome,
+                                              chrom=leftHit.target,
+                                              start=int(leftHit.hitStart),
+                                              end=int(leftHit.hitEnd),
+                                              padlen=padlen))
+            eleSeqRight = fastaRec(eleID + "_R",
+                                   '_'.join(['[' + leftHit.target + ':'
+                                             + str(rightHit.hitEnd),
+                                             str(rightHit.hitStart)]) + ']',
+                                   reverse_complement(
+                                       fetchPadded(genome=genome,
+                                                   chrom=leftHit.target,
+                                                   start=int(rightHit.hitStart),
+                                                   end=int(rightHit.hitEnd),
+                                                   padlen=padlen)))
             TIRleft = gffTup(model,
                              leftHit.target,
                              leftHit.hitStart,
@@ -882,14 +1450,15 @@ def writePairedTIRs(outDir=None, paired=None, hitIndex=None,
     for model in TIRpairs.keys():
         outfile = os.path.join(outDir, prefix + model + '_paired_TIR_hits_'
                                + str(model_counter * 2) + '.fasta')
-        with open(outfile, "w") as handle:
+        with open(outfile, "wb", buffering=1 << 20) as handle:
             for element in TIRpairs[model]:
-                element.seq.id = prefix + str(element.seq.id)
-                SeqIO.write(element.seq, handle, "fasta")
+                handle.write(formatFasta(prefix + element.seq.id,
+                                         element.seq.description,
+                                         element.seq.seq))
 
 
 def fetchUnpaired(hitIndex=None):
-    '''    Take list of unpaired hit IDs from listunpaired(),
+    '''    Take hits without a partner from hitIndex,
         Compose TIR gff3 record. '''
     orphans = list()
     gffTup = namedtuple('gffElem', ['model', 'chromosome', 'start', 'end',
@@ -897,7 +1466,7 @@ def fetchUnpaired(hitIndex=None):
                                     'rightHit', 'seq', 'evalue'])
     for model in hitIndex.keys():
         for recID in hitIndex[model].keys():
-            if not hitIndex[model][recID]['partner']:
+            if hitIndex[model][recID]['partner'] is None:
                 x = hitIndex[model][recID]['rec']
                 orphan = gffTup(x.model, x.target, x.hitStart, x.hitEnd,
                                 x.strand, "orphan_TIR", x.idx, None,
@@ -906,11 +1475,20 @@ def fetchUnpaired(hitIndex=None):
     return orphans
 
 
+def _gffLine(seqid, ftype, start, end, strand, attributes):
+    ''' Format a single GFF3 feature line.'''
+    return '\t'.join([str(seqid), "tirmite", ftype, str(start), str(end),
+                      ".", strand, ".", attributes]) + '\n'
+
+
 def gffWrite(outpath=None, featureList=list(), writeTIRs=True,
-             unpaired=None, suppressMeta=False, prefix=None):
+             unpaired=None, suppressMeta=False, prefix=None, handle=None,
+             batchSize=65536):
     '''
     Write predicted paired-TIR features (i.e. MITEs) from fetchElements()
     as GFF3. Optionally, write child TIRS and orphan TIRs to GFF3 also.
+    If handle is provided, write to this open binary file instead of outpath.
+    Lines are encoded in batches of batchSize features.
     '''
     if prefix:
         prefix = cleanID(prefix) + '_'
@@ -931,52 +1509,61 @@ def gffWrite(outpath=None, featureList=list(), writeTIRs=True,
     sortedFeatures = sorted(allfeatures, key=attrgetter('model', 'chromosome',
                                                         'start', 'end'))
     # Open GFF handle
-    with open(outpath, 'w') as file:
-        # Write headers
-        file.write('##gff-version 3' + '\n')
-        file.write('\t'.join(['#seqid', 'source', 'type', 'start', 'end',
-                              'score', 'strand', 'phase', 'attributes']) + '\n'
-                   )
-        # Format features for GFF3
-        for x in sortedFeatures:
-            if x.type == "orphan_TIR" and writeTIRs in ['all', 'unpaired']:
-                file.write('\t'.join([str(x.chromosome), "tirmite", x.type,
-                                      str(x.start), str(x.end), ".", x.strand,
-                                      ".", 'ID=' + prefix + str(x.model) + "_"
-                                      + str(x.id) + ';model=' + str(x.model)
-                                      + ';evalue=' + str(x.evalue) + ';']
-                                     ) + '\n'
-                           )
-            if x.type == "TIR_Element":
-                # Write Element line
-                file.write('\t'.join([str(x.chromosome), "tirmite", x.type,
-                                      str(x.start), str(x.end), ".", x.strand,
-                                      ".", 'ID=' + prefix + str(x.id)
-                                      + ';model=' + str(x.model) + ';']) + '\n'
-                           )
-                if writeTIRs in ['all', 'paired']:
-                    # Write left TIR line as child
-                    l = x.leftHit
-                    file.write('\t'.join([str(l.target), "tirmite",
-                                          "paired_TIR", str(l.hitStart),
-                                          str(l.hitEnd), ".", l.strand, ".",
-                                          'ID=' + prefix + str(x.model) + "_"
-                                          + str(l.idx) + ';model='
-                                          + str(x.model) + ';Parent='
-                                          + str(x.id) + ';evalue='
-                                          + str(l.evalue) + ';']) + '\n'
-                               )
-                    # Write right TIR line as child on neg strand
-                    r = x.rightHit
-                    file.write('\t'.join([str(r.target), "tirmite",
-                                          "paired_TIR", str(r.hitStart),
-                                          str(r.hitEnd), ".", r.strand, ".",
-                                          'ID=' + prefix + str(x.model) + "_"
-                                          + str(r.idx) + ';model='
-                                          + str(x.model) + ';Parent='
-                                          + str(x.id) + ';evalue='
-                                          + str(r.evalue) + ';']) + '\n'
-                               )
+    if handle is None:
+        with open(outpath, 'wb', buffering=1 << 20) as file:
+            _gffWriteFeatures(file, sortedFeatures, writeTIRs, prefix,
+                              batchSize)
+    else:
+        _gffWriteFeatures(handle, sortedFeatures, writeTIRs, prefix,
+                          batchSize)
+
+
+def _gffWriteFeatures(file, sortedFeatures, writeTIRs, prefix, batchSize):
+    ''' Write GFF3 headers and sorted features to open binary handle.'''
+    buf = bytearray()
+    # Write headers
+    buf += ('##gff-version 3' + '\n').encode()
+    buf += ('\t'.join(['#seqid', 'source', 'type', 'start', 'end',
+                       'score', 'strand', 'phase', 'attributes']) + '\n'
+            ).encode()
+    # Format features for GFF3
+    lines = list()
+    for count, x in enumerate(sortedFeatures, 1):
+        if x.type == "orphan_TIR" and writeTIRs in ['all', 'unpaired']:
+            lines.append(_gffLine(x.chromosome, x.type, x.start, x.end,
+                                  x.strand, 'ID=' + prefix + str(x.model)
+                                  + "_" + str(x.id) + ';model=' + str(x.model)
+                                  + ';evalue=' + str(x.evalue) + ';'))
+        if x.type == "TIR_Element":
+            # Write Element line
+            lines.append(_gffLine(x.chromosome, x.type, x.start, x.end,
+                                  x.strand, 'ID=' + prefix + str(x.id)
+                                  + ';model=' + str(x.model) + ';'))
+            if writeTIRs in ['all', 'paired']:
+                # Write left TIR line as child
+                l = x.leftHit
+                lines.append(_gffLine(l.target, "paired_TIR", l.hitStart,
+                                      l.hitEnd, l.strand, 'ID=' + prefix
+                                      + str(x.model) + "_" + str(l.idx)
+                                      + ';model=' + str(x.model) + ';Parent='
+                                      + str(x.id) + ';evalue='
+                                      + str(l.evalue) + ';'))
+                # Write right TIR line as child on neg strand
+                r = x.rightHit
+                lines.append(_gffLine(r.target, "paired_TIR", r.hitStart,
+                                      r.hitEnd, r.strand, 'ID=' + prefix
+                                      + str(x.model) + "_" + str(r.idx)
+                                      + ';model=' + str(x.model) + ';Parent='
+                                      + str(x.id) + ';evalue='
+                                      + str(r.evalue) + ';'))
+        # Flush batch of features
+        if count % batchSize == 0:
+            buf += ''.join(lines).encode()
+            file.write(buf)
+            buf = bytearray()
+            lines = list()
+    buf += ''.join(lines).encode()
+    file.write(buf)
 
 
 def getLTRs(elements=None, flankdist=10, minid=80, minterm=10, minseed=5,
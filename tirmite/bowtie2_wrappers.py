@@ -1,34 +1,87 @@
 import os
+import subprocess
 from shlex import quote
+from Bio import SeqIO
 
 def _bowtie2build_cmd(bt2Path="bowtie2-build",IdxPath="db/GenIdx",genome=None):
 	'''Construct the bowtie2-build command'''
 	# Base command
-	cmd = ' '.join(['mkdir db &&',quote(bt2Path),quote(os.path.abspath(genome)),IdxPath])
+	cmd = ' '.join(['mkdir -p',quote(os.path.dirname(IdxPath)),'&&',quote(bt2Path),quote(os.path.abspath(genome)),quote(IdxPath)])
 	return cmd
 
 def _bowtie2_cmd(bt2Path="bowtie2",tirFasta=None,IdxPath="db/GenIdx",cores=None):
-	'''Construct commands for bowtie2 mapping.'''
-	# bowtie2 -x genidx -f -a --very-sensitive-local -U TIR.fa --al alignments.bam 
+	'''Construct argument list for bowtie2 mapping. SAM is written to stdout.'''
+	# bowtie2 -x genidx -f -a --very-sensitive-local -U TIR.fa
 	# Base command
-	cmd = ' '.join([quote(bt2Path),'-f -a --very-sensitive-local -x',IdxPath,'-U',quote(os.path.abspath(tirFasta)),'> alignments.sam'])
+	cmd = [bt2Path,'-f','-a','--very-sensitive-local','-x',IdxPath,'-U',os.path.abspath(tirFasta)]
 	# Optional set cores
 	if cores:
-		cmd += ' --threads ' + str(cores)
+		cmd += ['--threads',str(cores)]
 	return cmd
 
-def _bam2bed_cmd(samPath="samtools",bedPath="bedtools",tempDir=None):
-	''' Filtering mapped reads with bedtools and samtools.
-	# Fwd hits
-	samtools view -b -F 0x10 alignments.sam | bedtools bamtobed -i stdin | awk -v OFS='\t' '{print $1,$2,$3,"+"}' > mapped.bed 
-	# Rev hits
-	samtools view -b -f 0x10 alignments.sam | bedtools bamtobed -i stdin | awk -v OFS='\t' '{print $1,$2,$3,"-"}' >> mapped.bed 
+def _split_fasta(infile=None,chunks=1,tempDir=None):
+	'''Distribute records from a fasta file across n chunk files.'''
+	records = list(SeqIO.parse(infile,"fasta"))
+	chunks = max(1,min(chunks,len(records)))
+	base = os.path.splitext(os.path.basename(infile))[0]
+	chunkPaths = list()
+	for i in range(chunks):
+		chunkPath = os.path.join(tempDir,base + '_chunk' + str(i) + '.fasta')
+		SeqIO.write(records[i::chunks],chunkPath,"fasta")
+		chunkPaths.append(chunkPath)
+	return chunkPaths
+
+def _start_bowtie2_pipeline(bt2Path="bowtie2",samPath="samtools",bedPath="bedtools",tirFasta=None,IdxPath="db/GenIdx",cores=None,outHandle=None):
+	'''Launch bowtie2 | samtools view -b -F 0x4 - | bedtools bamtobed -i stdin
+	with bamtobed output written to outHandle. Returns list of processes.'''
+	# Chain processes. Close parent copies of intermediate pipes so that
+	# upstream processes receive SIGPIPE if a downstream process exits.
+	bt2Proc = subprocess.Popen(_bowtie2_cmd(bt2Path=bt2Path,tirFasta=tirFasta,IdxPath=IdxPath,cores=cores),stdout=subprocess.PIPE)
+	# Drop unmapped reads
+	samProc = subprocess.Popen([samPath,'view','-b','-F','0x4','-'],stdin=bt2Proc.stdout,stdout=subprocess.PIPE)
+	bt2Proc.stdout.close()
+	bedProc = subprocess.Popen([bedPath,'bamtobed','-i','stdin'],stdin=samProc.stdout,stdout=outHandle)
+	samProc.stdout.close()
+	return [bt2Proc,samProc,bedProc]
+
+def _run_bowtie2_pipeline(bt2Path="bowtie2",samPath="samtools",bedPath="bedtools",tirFasta=None,IdxPath="db/GenIdx",cores=None,threadsPerInstance=8,tempDir=None):
+	''' Map TIRs with bowtie2 and stream alignments through samtools and bedtools.
+	bowtie2 throughput plateaus at high thread counts, so if more than
+	threadsPerInstance cores are available the TIR fasta is split and
+	mapped by several concurrent bowtie2 instances.
+	Mapped locations are written as: chrom, start, end, strand.
 	'''
-	# Base command
 	mappedPath = os.path.join(tempDir,'bowtie2mappedTIR.bed')
-	cmds = list() 
-	# All reads not on rev strand or unmapped
-	cmds.append(' '.join([quote(samPath),"view -b -F 0x10,0x4 alignments.sam |",quote(bedPath),"bamtobed -i stdin | awk -v OFS='\\t' '{print $1,$2,$3,\"+\"}' >",quote(mappedPath)]))
-	# Only reads on reverse strand
-	cmds.append(' '.join([quote(samPath),"view -b -f 0x10 alignments.sam |",quote(bedPath),"bamtobed -i stdin | awk -v OFS='\\t' '{print $1,$2,$3,\"-\"}' >>",quote(mappedPath)]))
-	return cmds,mappedPath
+	if not cores:
+		cores = 1
+	threads = max(1,min(cores,threadsPerInstance))
+	instances = max(1,cores // threads)
+	if instances > 1:
+		chunkPaths = _split_fasta(infile=tirFasta,chunks=instances,tempDir=tempDir)
+	else:
+		chunkPaths = [tirFasta]
+	# Launch one pipeline per chunk
+	jobs = list()
+	for i,chunkPath in enumerate(chunkPaths):
+		bedPart = mappedPath + '.' + str(i)
+		outHandle = open(bedPart,'wb')
+		procs = _start_bowtie2_pipeline(bt2Path=bt2Path,samPath=samPath,bedPath=bedPath,tirFasta=chunkPath,IdxPath=IdxPath,cores=threads,outHandle=outHandle)
+		jobs.append((bedPart,outHandle,procs))
+	# Wait for all pipelines and check exit status of each step
+	for bedPart,outHandle,procs in jobs:
+		for proc in procs:
+			proc.wait()
+		outHandle.close()
+	for bedPart,outHandle,procs in jobs:
+		for proc in procs:
+			if proc.returncode != 0:
+				raise subprocess.CalledProcessError(proc.returncode,proc.args)
+	# Merge outputs, keeping location and strand from bamtobed output
+	with open(mappedPath,'w') as out:
+		for bedPart,outHandle,procs in jobs:
+			with open(bedPart) as f:
+				for line in f:
+					li = line.rstrip('\n').split('\t')
+					out.write('\t'.join([li[0],li[1],li[2],li[5]]) + '\n')
+			os.remove(bedPart)
+	return mappedPath
@@ -8,6 +8,7 @@ import glob
 import shutil
 import tirmite
 import argparse
+import functools
 
 
 def log(*args, **kwargs):
@@ -50,6 +51,7 @@ def mainArgs():
     #parser.add_argument('--bt2build',type=str,default='bowtie2-build',help='Set location of bowtie2-build if not in PATH.')
     #parser.add_argument('--samtools',type=str,default='samtools',help='Set location of samtools if not in PATH.')
     #parser.add_argument('--bedtools',type=str,default='bedtools',help='Set location of bedtools if not in PATH.')
+    #parser.add_argument('--btThreads',type=int,default=8,help='Max threads per bowtie2 instance. If --cores is larger, TIRs are split across multiple bowtie2 instances.')
     # Pairing heuristics
     parser.add_argument('--stableReps',type=int,
                         default=0,
@@ -83,7 +85,10 @@ def mainArgs():
     # HMMER options
     parser.add_argument('--cores', type=int,
                         default=1,
-                        help='Set number of cores available to hmmer software.')
+                        help='Set number of cores available to hmmer software and sequence extraction.')
+    parser.add_argument('--hmmThreads', type=int,
+                        default=2,
+                        help='Threads per nhmmer process, capped by --cores. Models are searched in parallel by --cores / --hmmThreads processes. Default = 2')
     parser.add_argument('--maxeval', type=float,
                         default=0.001,
                         help='Maximum e-value allowed for valid hit. Default = 0.001')
@@ -113,8 +118,17 @@ def mainArgs():
     return args
 
 
-def missing_tool(tool_name):
+@functools.lru_cache(maxsize=None)
+def resolve_tool(tool_name):
+    '''Return absolute path to tool, or None if not found.'''
     path = shutil.which(tool_name)
+    if path is not None:
+        path = os.path.abspath(path)
+    return path
+
+
+def missing_tool(tool_name):
+    path = resolve_tool(tool_name)
     if path is None:
         return [tool_name]
     else:
@@ -127,12 +141,16 @@ def main():
     args = mainArgs()
 
     # Check for required programs.
-    # tools = [args.hmmpress,args.nhmmer,args.hmmbuild,args.bowtie2,args.bt2build,args.samtools,args.bedtools]
-    tools = [args.hmmpress, args.nhmmer, args.hmmbuild]
+    # tools = ['hmmpress','nhmmer','hmmbuild','bowtie2','bt2build','samtools','bedtools']
+    tools = ['hmmpress', 'nhmmer', 'hmmbuild']
 
     missing_tools = []
     for tool in tools:
-        missing_tools += missing_tool(tool)
+        exe = getattr(args, tool)
+        missing_tools += missing_tool(exe)
+        # Reuse resolved absolute path in later commands
+        if resolve_tool(exe):
+            setattr(args, tool, resolve_tool(exe))
     if missing_tools:
         log('WARNING: Some tools required by tirmite could not be found: ' +
             ', '.join(missing_tools))
@@ -143,20 +161,18 @@ def main():
 
     # Load reference genome
     log("Log: Loading genome from: %s " % args.genome)
-    genome = tirmite.importFasta(args.genome)
+    genome = tirmite.loadGenome(args.genome)
 
     #if args.useBowtie2:
     #    # Check that input fasta exists
     #    tirmite.isfile(args.btTIR)
     #    btTIRname = tirmite.getbtName(args.btTIR)
-    #    # Compose bowtie map and filter commands
-    #    cmds = list()
-    #    cmds.append(tirmite._bowtie2build_cmd(bt2Path=args.bt2build,genome=args.genome))
-    #    cmds.append(tirmite._bowtie2_cmd(bt2Path=args.bowtie2,tirFasta=args.btTIR,cores=args.cores))
-    #    bam2bed_cmds,mappedPath = tirmite._bam2bed_cmd(samPath=args.samtools,bedPath=args.bedtools,tempDir=tempDir)
-    #    cmds += bam2bed_cmds
-    #    # Run mapp and filter
+    #    # Build genome index
+    #    idxPath = os.path.join(tempDir,'db','GenIdx')
+    #    cmds = [tirmite._bowtie2build_cmd(bt2Path=args.bt2build,IdxPath=idxPath,genome=args.genome)]
     #    tirmite.run_cmd(cmds,verbose=args.verbose,keeptemp=args.keeptemp)
+    #    # Map and filter as a single stream
+    #    mappedPath = tirmite._run_bowtie2_pipeline(bt2Path=args.bowtie2,samPath=args.samtools,bedPath=args.bedtools,tirFasta=args.btTIR,IdxPath=idxPath,cores=args.cores,threadsPerInstance=args.btThreads,tempDir=tempDir)
     #    # Import mapping locations
     #    hitTable = tirmite.import_mapped(infile=mappedPath,tirName=btTIRname,prefix=args.prefix)
     #else:
@@ -168,7 +184,7 @@ def main():
             log("WARNING: BED file %s not found. Quitting." % args.pairbed)
             # Remove temp directory
             if not args.keeptemp:
-                shutil.rmtree(tempDir)
+                tirmite.cleanTemp(tempDir)
             sys.exit(1)
 
         log("Log: Skipping HMM search. Using custom TIRs from file: %s" %args.pairbed)
@@ -197,25 +213,25 @@ def main():
                               hitTable=hitTable,
                               maxeval=args.maxeval,
                               genome=genome,
-                              padlen=args.padlen
+                              padlen=args.padlen,
+                              cores=args.cores
                               )
             log("Log: Pairing is off. Reporting hits only.")
             # Remove temp directory
             if not args.keeptemp:
-                shutil.rmtree(tempDir)
+                tirmite.cleanTemp(tempDir)
             sys.exit(1)
 
     # Else run nhmmer and load TIR hits.
     else:
-        # If raw alignments provided, convert to stockholm format.
+        # If raw alignments provided, convert to stockholm format as they
+        # are piped to hmmbuild.
         if args.alnDir or args.alnFile:
-            stockholmDir = tirmite.convertAlign(alnDir=args.alnDir,
-                                                alnFile=args.alnFile,
-                                                inFormat=args.alnFormat,
-                                                tempDir=tempDir
-                                                )
+            alignments = tirmite.iterStockholm(alnDir=args.alnDir,
+                                               alnFile=args.alnFile,
+                                               inFormat=args.alnFormat)
         else:
-            stockholmDir = None
+            alignments = None
 
         # If pre-built HMM provided, check correct format.
         if args.hmmFile:
@@ -223,46 +239,83 @@ def main():
                 log("WARNING: --hmmFile has non-hmm extension. Exiting.")
                 # Remove temp directory
                 if not args.keeptemp:
-                    shutil.rmtree(tempDir)
+                    tirmite.cleanTemp(tempDir)
                 sys.exit(1)
 
-        # Compose and run HMMER commands
-        cmds, resultDir, hmmDB = tirmite.cmdScript(hmmDir=args.hmmDir,
-                                                   hmmFile=args.hmmFile,
-                                                   alnDir=stockholmDir,
-                                                   tempDir=tempDir,
-                                                   args=args
-                                                   )
-        tirmite.run_cmd(cmds,
-                        verbose=args.verbose,
-                        tempDir=tempDir,
-                        keeptemp=args.keeptemp)
-
-        # Die if no hits found
-        if not glob.glob(os.path.join(os.path.abspath(resultDir), '*.tab')):
-            log("Log: No hits found in %s . Quitting." % resultDir)
-            # Remove temp directory
-            if not args.keeptemp:
-                shutil.rmtree(tempDir)
-            sys.exit(1)
+        # Search in-process with pyhmmer if available. Custom score matrices
+        # are only supported by the nhmmer executable.
+        usePyhmmer = tirmite.pyhmmer is not None and not args.matrix
 
-        # Import hits from nhmmer result files
-        hitTable = None
-        modelCount = 0
-        for resultfile in glob.glob(os.path.join(os.path.abspath(resultDir), '*.tab')):
-            log("Log: Loading nhmmer hits from: %s " % resultfile)
-            hitTable = tirmite.import_nhmmer(infile=resultfile,
-                                             hitTable=hitTable,
-                                             prefix=args.prefix
-                                             )
-            modelCount += 1
+        if usePyhmmer and args.hmmFile and not (args.hmmDir or alignments):
+            # Single pre-built model: search it in place, no need to stage
+            # models or compose HMMER commands.
+            hmmPaths = [os.path.abspath(args.hmmFile)]
+        else:
+            # Compose HMMER commands
+            cmds, resultDir, hmmDB = tirmite.cmdScript(hmmDir=args.hmmDir,
+                                                       hmmFile=args.hmmFile,
+                                                       tempDir=tempDir,
+                                                       args=args,
+                                                       alignments=alignments
+                                                       )
+            hmmPaths = glob.glob(os.path.join(hmmDB, '*.hmm'))
+
+        if usePyhmmer:
+            # Cache optimized models alongside --hmmDir if it is the only
+            # source of models.
+            if args.hmmDir and not (args.hmmFile or alignments):
+                hmmCache = os.path.join(os.path.abspath(args.hmmDir), 'tirmite_models.h3m')
+            else:
+                hmmCache = None
+            log("Log: Running nhmmer search with pyhmmer on %s models. " % str(len(hmmPaths)))
+            hitTable = tirmite.run_nhmmer_pyhmmer(genome=args.genome,
+                                                  hmm_paths=hmmPaths,
+                                                  args=args,
+                                                  cache=hmmCache
+                                                  )
+            modelCount = len(hmmPaths)
+
+            # Die if no hits found
+            if hitTable is None:
+                log("Log: No hits found. Quitting.")
+                # Remove temp directory
+                if not args.keeptemp:
+                    tirmite.cleanTemp(tempDir)
+                sys.exit(1)
+
+        else:
+            # Run one nhmmer process per model, each with --hmmThreads cores
+            # (capped by --cores)
+            tirmite.run_parallel(cmds,
+                                 workers=max(1, args.cores // tirmite.nhmmerThreads(args)),
+                                 verbose=args.verbose)
+
+            # List nhmmer result files once
+            resultFiles = [e.path for e in os.scandir(os.path.abspath(resultDir))
+                           if e.name.endswith('.tab')]
+
+            # Die if no hits found
+            if not resultFiles:
+                log("Log: No hits found in %s . Quitting." % resultDir)
+                # Remove temp directory
+                if not args.keeptemp:
+                    tirmite.cleanTemp(tempDir)
+                sys.exit(1)
+
+            # Import hits from nhmmer result files, merge once
+            hitFrames = list()
+            for resultfile in resultFiles:
+                log("Log: Loading nhmmer hits from: %s " % resultfile)
+                hitFrames.append(tirmite.read_nhmmer(infile=resultfile))
+            hitTable = tirmite.mergeHits(hitFrames)
+            modelCount = len(hitFrames)
 
         log("Log: Imported %s hits from %s models. " % (str(len(hitTable.index)),str(modelCount)))
 
         # Apply hit length filters
         log("Log: Filtering hits with < %s model coverage. " % str(args.mincov))
         hitCount = len(hitTable.index)
-        hitTable = tirmite.filterHitsLen(hmmDB=hmmDB, mincov=args.mincov, hitTable=hitTable)
+        hitTable = tirmite.filterHitsLen(hmmFiles=hmmPaths, mincov=args.mincov, hitTable=hitTable)
         log("Log: Excluded %s hits on coverage criteria. " % str(hitCount - len(hitTable.index)))
         log("Log: Remaining hits: %s " % str(len(hitTable.index)))
 
@@ -282,12 +335,13 @@ def main():
                               hitTable=hitTable,
                               maxeval=args.maxeval,
                               genome=genome,
-                              padlen=args.padlen
+                              padlen=args.padlen,
+                              cores=args.cores
                               )
             log("Log: Pairing is off. Reporting hits only.")
             # Remove temp directory
             if not args.keeptemp:
-                shutil.rmtree(tempDir)
+                tirmite.cleanTemp(tempDir)
             sys.exit(1)
 
     # Run pairing on filtered TIR set
@@ -298,6 +352,9 @@ def main():
     # Run iterative pairing procedure
     hitIndex,paired,unpaired = tirmite.iterateGetPairs(hitIndex, stableReps=args.stableReps)
 
+    # Start one pool of sequence extraction workers for hits and elements
+    fetchPool = tirmite.fetchPool(genome=genome, cores=args.cores)
+
     # Write TIR hits to fasta for each pHMM
     log("Log: Writing all valid TIR hits to fasta.")
     tirmite.writeTIRs(outDir=outDir,
@@ -305,7 +362,9 @@ def main():
                       maxeval=args.maxeval,
                       genome=genome,
                       prefix=args.prefix,
-                      padlen=args.padlen)
+                      padlen=args.padlen,
+                      cores=args.cores,
+                      pool=fetchPool)
 
     # Write paired TIR hits to fasta. Pairs named as element ID + L/R tag.
     if args.reportTIR in ['all', 'paired']:
@@ -321,7 +380,11 @@ def main():
     # as list of gffTup objects
     pairedEles = tirmite.fetchElements(paired=paired,
                                        hitIndex=hitIndex,
-                                       genome=genome)
+                                       genome=genome,
+                                       cores=args.cores,
+                                       pool=fetchPool)
+    if fetchPool is not None:
+        fetchPool.shutdown()
 
     # Write paired-TIR features to fasta
     log("Log: Writing TIR-elements to fasta.")
@@ -343,12 +406,14 @@ def main():
             gffOutPath = os.path.join(outDir, "tirmite_report.gff3")
         # Write gff3
         log("Log: Writing features to gff: %s " % gffOutPath)
-        tirmite.gffWrite(outpath=gffOutPath,
-                         featureList=pairedEles,
-                         writeTIRs=args.reportTIR,
-                         unpaired=unpairedTIRs,
-                         prefix=args.prefix)
+        with open(gffOutPath, 'wb', buffering=1 << 20) as gffHandle:
+            tirmite.gffWrite(outpath=gffOutPath,
+                             featureList=pairedEles,
+                             writeTIRs=args.reportTIR,
+                             unpaired=unpairedTIRs,
+                             prefix=args.prefix,
+                             handle=gffHandle)
 
     # Remove temp directory
     if not args.keeptemp:
-        shutil.rmtree(tempDir)
+        tirmite.cleanTemp(tempDir)
@@ -8,8 +8,9 @@ def cleanID(s):
 	s = re.sub(r"\s+", '_', s)
 	return s
 
-def _hmmbuild_command(exePath="hmmbuild",modelname=None,cores=None,inAlign=None,outdir=None):
-	'''Construct the hmmbuild command'''
+def _hmmbuild_command(exePath="hmmbuild",modelname=None,cores=None,inAlign=None,outdir=None,informat=None):
+	'''Construct the hmmbuild command. If inAlign is "-" the alignment is read from stdin,
+	which requires informat to be set.'''
 	# Make model name compliant
 	modelname = cleanID(modelname)
 	# Check for outdir
@@ -28,12 +29,16 @@ def _hmmbuild_command(exePath="hmmbuild",modelname=None,cores=None,inAlign=None,
 	# Optional set cores
 	if cores:
 		command += ' --cpu ' + str(cores)
+	if informat:
+		command += ' --informat ' + informat
 	if outdir:
 		modelout = os.path.join(outdir,modelname + ".hmm")
 	else:
 		modelout = modelname + ".hmm"
 	# Append output file name and source alignment, return command string
-	command = ' '.join([command,quote(os.path.abspath(modelout)),quote(os.path.abspath(inAlign))])
+	if inAlign != '-':
+		inAlign = os.path.abspath(inAlign)
+	command = ' '.join([command,quote(os.path.abspath(modelout)),quote(inAlign)])
 	return command,os.path.abspath(modelout)
 
 def _hmmpress_command(exePath="hmmpress", hmmfile=None):
@@ -42,8 +47,23 @@ def _hmmpress_command(exePath="hmmpress", hmmfile=None):
 	command = quote(exePath) + " -f " + quote(os.path.abspath(hmmfile))
 	return command
 
-def _nhmmer_command(exePath="nhmmer",modelPath=None,genome=None,evalue=None,nobias=False,matrix=None,cores=None,outdir=None):
-	'''Construct the nhmmer command'''
+def _nhmmer_base_command(exePath="nhmmer",evalue=None,nobias=False,matrix=None,cores=None):
+	'''Construct the nhmmer options shared by all models'''
+	command = quote(exePath)
+	if cores:
+			command += ' --cpu ' + str(cores)
+	if evalue:
+			command += ' -E ' + str(evalue)
+	if nobias:
+		command += ' --nobias'
+	if matrix:
+		command += ' --mxfile ' + quote(os.path.abspath(matrix))
+	command += " --noali --notextw --dna --max"
+	return command
+
+def _nhmmer_command(exePath="nhmmer",modelPath=None,genome=None,evalue=None,nobias=False,matrix=None,cores=None,outdir=None,base=None):
+	'''Construct the nhmmer command. If base is set, use it as the prebuilt
+	command prefix from _nhmmer_base_command()'''
 	# Get model hmm basename
 	model_base = os.path.splitext(os.path.basename(modelPath))[0]
 	# Check for outdir
@@ -59,14 +79,7 @@ def _nhmmer_command(exePath="nhmmer",modelPath=None,genome=None,evalue=None,nobi
 		os.makedirs(outdir)
 	# Create resultfile name
 	outfile = os.path.join(os.path.abspath(outdir),model_base + ".tab")
-	command = quote(exePath) + " --tblout " + quote(outfile)
-	if cores:
-			command += ' --cpu ' + str(cores)
-	if evalue:
-			command += ' -E ' + str(evalue)
-	if nobias:
-		command += ' --nobias'
-	if matrix:
-		command += ' --mxfile ' + quote(os.path.abspath(matrix))
-	command += " --noali --notextw --dna --max " + quote(os.path.abspath(modelPath)) + " " + quote(os.path.abspath(genome))
+	if base is None:
+		base = _nhmmer_base_command(exePath=exePath,evalue=evalue,nobias=nobias,matrix=matrix,cores=cores)
+	command = ' '.join([base,"--tblout",quote(outfile),quote(os.path.abspath(modelPath)),quote(os.path.abspath(genome))])
 	return command,outdir
\ No newline at end of file